@@ -3,20 +3,39 @@
 upload_log.py - Upload ArduPilot flight logs to Firebase Storage
 
 This script finds the most recent ArduPilot .bin flight log file from a specified directory
-and uploads it to Firebase Storage at path: /logs/{taskId}.bin.
+and uploads it to Firebase Storage at path: /logs/{taskId}.bin.zst (zstd-compressed),
+or /logs/{taskId}.bin when COMPRESS_LOGS=0.
 """
 import argparse
+import hashlib
+import json
 import os
-import glob
 import logging
-from datetime import datetime
-from typing import Optional, Tuple
+import queue
+import re
+import socket
+import stat
+import tarfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import firebase_admin
 from firebase_admin import credentials, storage
+from google.api_core import exceptions as api_exceptions
+from google.auth import exceptions as auth_exceptions
+from google.cloud.storage import transfer_manager
 from dotenv import load_dotenv
+import requests
+import zstandard as zstd
 
 
+# Pin TZ so glibc does not re-stat /etc/localtime for every log timestamp
+os.environ.setdefault("TZ", ":/etc/localtime")
+if hasattr(time, "tzset"):
+    time.tzset()
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -24,14 +43,133 @@ logging.basicConfig(
 )
 logger = logging.getLogger("upload_log")
 
+# Configuration file and the variables that must be set
+DOTENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+REQUIRED_ENV_VARS = ("CREDENTIALS_PATH", "STORAGE_BUCKET", "LOGS_DIR", "TASK_ID")
+
+# Resumable upload chunk size (GCS requires a multiple of 256 KiB)
+UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024  # 32 MiB
+
+# Files above this size are uploaded as parallel parts
+PARALLEL_UPLOAD_THRESHOLD = 16 * 1024 * 1024  # 16 MiB
+PARALLEL_CHUNK_SIZE = 16 * 1024 * 1024  # 16 MiB per part
+PARALLEL_UPLOAD_WORKERS = 8
+
+# zstd compression level for uploaded logs
+ZSTD_LEVEL = 3
+
+# Size of each read from a log file while compressing
+FILE_READ_SIZE = 1024 * 1024  # 1 MiB
+
+# How often watch mode re-probes mount bases for newly plugged-in Pixhawks
+WATCH_RESCAN_INTERVAL = 10.0  # seconds
+
+# Failed attempts after which watch mode stops retrying a log
+WATCH_MAX_ATTEMPTS = 5
+
+# Errors treated as a lost uplink rather than a problem with one file
+CONNECTIVITY_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    socket.gaierror,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    auth_exceptions.TransportError
+)
+
+# Record of logs already uploaded in bundle and watch modes
+DEFAULT_UPLOAD_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".upload_state.json")
+
+# Common Pixhawk volume names
+PIXHAWK_NAMES = ("PIXHAWK", "APM", "PX4", "FMUV", "MINDPX")
+PIXHAWK_NAME_RE = re.compile("|".join(PIXHAWK_NAMES), re.IGNORECASE)
+
+# Maximum time to wait for all mount bases to be probed
+MOUNT_PROBE_TIMEOUT = 2.0  # seconds
+
+# How long discovered Pixhawk log directories are reused before re-probing
+PIXHAWK_CACHE_TTL = 5.0  # seconds
 
-def find_pixhawk_mount_paths() -> list:
+# Cached (timestamp, paths) result of find_pixhawk_mount_paths
+_pixhawk_paths_cache = None
+
+# How long a missing mount base is remembered before probing it again.
+# Must exceed PIXHAWK_CACHE_TTL to save any probes; it also bounds how long
+# a Pixhawk can go unnoticed when its mount base (e.g. /media/pi) only
+# appears on first plug-in.
+MISSING_MOUNT_TTL = 30.0  # seconds
+
+# Mount bases that did not exist, mapped to when they were last probed
+_missing_mount_bases = {}
+
+# Mount bases with a probe thread still running, and the lock guarding them
+_probing_mount_bases = set()
+_probing_lock = threading.Lock()
+
+
+def probe_mount_base(base_dir: str) -> list:
+    """
+    Look for Pixhawk log directories under a single mount base.
+    
+    Args:
+        base_dir: Mount base directory to scan (e.g. /media/pi)
+        
+    Returns:
+        List of Pixhawk log directories found under base_dir
+    """
+    found_paths = []
+    
+    # Skip bases that were recently found to be missing
+    if time.monotonic() - _missing_mount_bases.get(base_dir, float("-inf")) < MISSING_MOUNT_TTL:
+        return found_paths
+    
+    try:
+        it = os.scandir(base_dir)
+    except FileNotFoundError:
+        _missing_mount_bases[base_dir] = time.monotonic()
+        return found_paths
+    except (NotADirectoryError, PermissionError):
+        return found_paths
+    _missing_mount_bases.pop(base_dir, None)
+    with it:
+        for entry in it:
+            # Check the name before issuing any further stat calls
+            if not PIXHAWK_NAME_RE.search(entry.name):
+                continue
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            # Add the APM/logs directory and logs directly in the root if they exist
+            for logs_path in (os.path.join(entry.path, "APM", "logs"),
+                              os.path.join(entry.path, "logs")):
+                try:
+                    if stat.S_ISDIR(os.stat(logs_path).st_mode):
+                        found_paths.append(logs_path)
+                except (FileNotFoundError, NotADirectoryError):
+                    pass
+    return found_paths
+
+
+def find_pixhawk_mount_paths(log_level: int = logging.INFO) -> list:
     """
     Attempt to find Pixhawk mount points on the system.
     
+    Mount bases are probed concurrently so a single hung mount (e.g. a stale
+    network or autofs path) cannot stall discovery for longer than
+    MOUNT_PROBE_TIMEOUT seconds. Results are cached for PIXHAWK_CACHE_TTL
+    seconds so repeated lookups within one process do not re-probe the
+    mount directories.
+    
+    Args:
+        log_level: Level for the summary log line (DEBUG for periodic rescans)
+        
     Returns:
         List of potential Pixhawk mounted log directories
     """
+    global _pixhawk_paths_cache
+    now = time.monotonic()
+    if _pixhawk_paths_cache is not None and now - _pixhawk_paths_cache[0] < PIXHAWK_CACHE_TTL:
+        return list(_pixhawk_paths_cache[1])
+    
     potential_paths = []
     
     # Common base mount points
@@ -42,35 +180,111 @@ def find_pixhawk_mount_paths() -> list:
         "/run/media/$USER" # For some Linux distributions
     ]
     
-    # Replace $USER with actual username if needed
+    # Replace $USER with actual username if needed, dropping duplicates
+    # (e.g. /media/$USER is /media/pi for the pi user)
     username = os.environ.get("USER", "pi")
-    mount_base_dirs = [path.replace("$USER", username) for path in mount_base_dirs]
-    
-    # Common Pixhawk volume names
-    pixhawk_names = ["PIXHAWK", "APM", "PX4", "FMUV", "MINDPX"]
-    
-    # Check for mounted Pixhawk
-    for base_dir in mount_base_dirs:
-        if os.path.exists(base_dir):
-            # Look for directories that might be a Pixhawk
-            for item in os.listdir(base_dir):
-                full_path = os.path.join(base_dir, item)
-                if os.path.isdir(full_path):
-                    # Check if directory name matches known Pixhawk names
-                    if any(pixname in item.upper() for pixname in pixhawk_names):
-                        # Add the APM/logs directory if it exists
-                        logs_path = os.path.join(full_path, "APM", "logs")
-                        if os.path.isdir(logs_path):
-                            potential_paths.append(logs_path)
-                        # Also check for logs directly in the root
-                        logs_path = os.path.join(full_path, "logs")
-                        if os.path.isdir(logs_path):
-                            potential_paths.append(logs_path)
-    
-    logger.info(f"Found {len(potential_paths)} potential Pixhawk log directories: {potential_paths}")
+    mount_base_dirs = list(dict.fromkeys(path.replace("$USER", username) for path in mount_base_dirs))
+    
+    # Check for mounted Pixhawk on all bases in parallel. Daemon threads are
+    # used so a probe stuck in a hung mount cannot block interpreter exit.
+    results = queue.Queue()
+    
+    def probe(index, base_dir):
+        try:
+            found_paths = probe_mount_base(base_dir)
+        except Exception as e:
+            logger.warning(f"Failed to probe mount directory {base_dir}: {str(e)}")
+            found_paths = []
+        finally:
+            with _probing_lock:
+                _probing_mount_bases.discard(base_dir)
+        results.put((index, found_paths))
+    
+    # Skip bases whose previous probe is still stuck rather than piling up threads
+    started = 0
+    for index, base_dir in enumerate(mount_base_dirs):
+        with _probing_lock:
+            if base_dir in _probing_mount_bases:
+                logger.debug(f"Skipping {base_dir}: previous probe has not returned")
+                continue
+            _probing_mount_bases.add(base_dir)
+        threading.Thread(target=probe, args=(index, base_dir), daemon=True).start()
+        started += 1
+    
+    deadline = time.monotonic() + MOUNT_PROBE_TIMEOUT
+    probed = {}
+    while len(probed) < started:
+        try:
+            index, found_paths = results.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            logger.warning(f"Timed out after {MOUNT_PROBE_TIMEOUT}s probing mount directories; results may be incomplete")
+            break
+        probed[index] = found_paths
+    
+    # Keep results in mount base order regardless of completion order
+    for index in sorted(probed):
+        potential_paths.extend(probed[index])
+    
+    _pixhawk_paths_cache = (now, list(potential_paths))
+    logger.log(log_level, f"Found {len(potential_paths)} potential Pixhawk log directories: {potential_paths}")
     return potential_paths
 
 
+def scan_bin_files(directory: str) -> Iterator[Tuple[str, float]]:
+    """
+    Yield the .bin files in a directory together with their modification times.
+    
+    Uses a single os.scandir pass so each file's mtime comes from the
+    DirEntry stat result instead of a separate stat call.
+    
+    Args:
+        directory: Path to the directory to scan
+        
+    Yields:
+        (path, mtime) tuples for each .bin file found
+        
+    Raises:
+        OSError: If the directory cannot be read
+    """
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(".bin") and entry.is_file(follow_symlinks=False):
+                yield entry.path, entry.stat().st_mtime
+
+
+def iter_bin_files(logs_dir: str) -> Iterator[Tuple[str, float]]:
+    """
+    Yield every .bin file in the specified directory and in Pixhawk mount paths.
+    
+    Args:
+        logs_dir: Path to the directory containing log files
+        
+    Yields:
+        (path, mtime) tuples for each .bin file found
+    """
+    # Check the specified logs directory first, then any auto-mounted Pixhawk devices
+    search_dirs = [(logs_dir, "specified logs directory")]
+    search_dirs += [(path, "auto-discovered path") for path in find_pixhawk_mount_paths()]
+    
+    seen_dirs = set()
+    for path, description in search_dirs:
+        # LOGS_DIR often points at a Pixhawk mount that is also auto-discovered
+        norm_path = os.path.normpath(path)
+        if norm_path in seen_dirs:
+            continue
+        seen_dirs.add(norm_path)
+        
+        count = 0
+        try:
+            for file_path, mtime in scan_bin_files(path):
+                count += 1
+                yield file_path, mtime
+        except OSError as e:
+            logger.warning(f"Could not read {description} {path}: {str(e)}")
+            continue
+        logger.info(f"Found {count} .bin files in {description}: {path}")
+
+
 def find_latest_bin_file(logs_dir: str) -> Optional[str]:
     """
     Find the most recent .bin file in the specified directory or in Pixhawk mount paths.
@@ -81,33 +295,19 @@ def find_latest_bin_file(logs_dir: str) -> Optional[str]:
     Returns:
         Path to the latest .bin file or None if not found
     """
-    # List to store all found bin files
-    all_bin_files = []
+    latest_file = None
+    latest_mtime = -1.0
     
-    # First, check the specified logs directory
-    if os.path.isdir(logs_dir):
-        bin_files = glob.glob(os.path.join(logs_dir, "*.bin"))
-        for file in bin_files:
-            all_bin_files.append(file)
-        logger.info(f"Found {len(bin_files)} .bin files in specified logs directory: {logs_dir}")
-    else:
-        logger.warning(f"Specified log directory does not exist: {logs_dir}")
-    
-    # Next, try to find auto-mounted Pixhawk devices
-    pixhawk_paths = find_pixhawk_mount_paths()
-    for path in pixhawk_paths:
-        bin_files = glob.glob(os.path.join(path, "*.bin"))
-        for file in bin_files:
-            all_bin_files.append(file)
-        logger.info(f"Found {len(bin_files)} .bin files in auto-discovered path: {path}")
+    # Track the newest file in the same pass over the directories
+    for file_path, mtime in iter_bin_files(logs_dir):
+        if mtime > latest_mtime:
+            latest_file, latest_mtime = file_path, mtime
     
-    if not all_bin_files:
+    if latest_file is None:
         logger.warning("No .bin files found in any location")
         return None
     
-    # Sort files by modification time (newest first)
-    latest_file = max(all_bin_files, key=os.path.getmtime)
-    logger.info(f"Found latest log file: {latest_file} (modified: {datetime.fromtimestamp(os.path.getmtime(latest_file))})")
+    logger.info(f"Found latest log file: {latest_file} (modified: {datetime.fromtimestamp(latest_mtime)})")
     
     return latest_file
 
@@ -123,6 +323,10 @@ def initialize_firebase(credentials_path: str, bucket_name: str) -> Optional[fir
     Returns:
         Firebase app instance or None if initialization failed
     """
+    # Reuse the default app if this process has already initialized one
+    if firebase_admin._apps:
+        return firebase_admin.get_app()
+    
     try:
         cred = credentials.Certificate(credentials_path)
         app = firebase_admin.initialize_app(cred, {
@@ -135,40 +339,100 @@ def initialize_firebase(credentials_path: str, bucket_name: str) -> Optional[fir
         return None
 
 
-def upload_to_firebase(file_path: str, destination_path: str) -> bool:
+def upload_file_to_storage(file_path: str, destination_path: str, compress: bool = False,
+                           if_generation_match: Optional[int] = None) -> None:
+    """
+    Upload a file to Firebase Storage, raising on failure.
+    
+    Args:
+        file_path: Path to the local file to upload
+        destination_path: Destination path in Firebase Storage
+        compress: Compress the file with zstd while uploading
+        if_generation_match: Generation precondition for the upload (0 means
+            fail if the object already exists). The parallel multipart path
+            does not support preconditions, so it is skipped when this is set.
+        
+    Raises:
+        Exception: Any error from reading the file or from the Storage API
+    """
+    bucket = storage.bucket()
+    blob = bucket.blob(destination_path, chunk_size=UPLOAD_CHUNK_SIZE)
+    
+    file_size = os.path.getsize(file_path)
+    if compress:
+        # Compress on the fly; the compressed size is unknown up front,
+        # so this always goes through a chunked resumable upload.
+        # The source is unbuffered so zstd reads straight from the file
+        # into its input buffer without an extra userland copy. No size is
+        # passed because the newest log may still be growing while it is read.
+        cctx = zstd.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+        with open(file_path, "rb", buffering=0) as src:
+            with cctx.stream_reader(src, read_size=FILE_READ_SIZE) as reader:
+                blob.upload_from_file(
+                    reader,
+                    content_type="application/zstd",
+                    timeout=600,
+                    if_generation_match=if_generation_match
+                )
+    elif file_size > PARALLEL_UPLOAD_THRESHOLD and if_generation_match is None:
+        # Upload large files as concurrent parts via the XML multipart API
+        transfer_manager.upload_chunks_concurrently(
+            file_path,
+            blob,
+            content_type="application/octet-stream",
+            chunk_size=PARALLEL_CHUNK_SIZE,
+            max_workers=PARALLEL_UPLOAD_WORKERS,
+            worker_type=transfer_manager.THREAD
+        )
+    else:
+        # Stream small files through a single resumable upload; each
+        # chunk-sized read goes straight to the file with no Python-level buffer
+        with open(file_path, "rb", buffering=0) as f:
+            blob.upload_from_file(
+                f,
+                size=file_size,
+                content_type="application/octet-stream",
+                timeout=600,
+                if_generation_match=if_generation_match
+            )
+    
+    logger.info(f"Successfully uploaded {file_path} to {destination_path}")
+
+
+def upload_to_firebase(file_path: str, destination_path: str, compress: bool = False,
+                       if_generation_match: Optional[int] = None) -> bool:
     """
     Upload a file to Firebase Storage.
     
     Args:
         file_path: Path to the local file to upload
         destination_path: Destination path in Firebase Storage
+        compress: Compress the file with zstd while uploading
+        if_generation_match: Generation precondition for the upload (0 means
+            fail if the object already exists)
         
     Returns:
         True if upload was successful, False otherwise
     """
     try:
-        bucket = storage.bucket()
-        blob = bucket.blob(destination_path)
-        
-        # Upload the file
-        blob.upload_from_filename(file_path)
-        
-        logger.info(f"Successfully uploaded {file_path} to {destination_path}")
+        upload_file_to_storage(file_path, destination_path, compress, if_generation_match)
         return True
     except Exception as e:
         logger.error(f"Failed to upload file: {str(e)}")
         return False
 
 
-def load_config() -> Tuple[str, str, str, str]:
+def load_config() -> Tuple[str, str, str, str, bool]:
     """
     Load configuration from environment variables.
     
     Returns:
-        Tuple of (credentials_path, storage_bucket, logs_dir, task_id)
+        Tuple of (credentials_path, storage_bucket, logs_dir, task_id, compress_logs)
     """
-    # Load environment variables from .env file
-    load_dotenv()
+    # Load environment variables from the .env file next to this script,
+    # unless the required ones were already provided by the environment
+    if not all(os.environ.get(key) for key in REQUIRED_ENV_VARS):
+        load_dotenv(dotenv_path=DOTENV_PATH, override=False)
     
     # Get required environment variables
     credentials_path = os.environ.get("CREDENTIALS_PATH")
@@ -176,9 +440,15 @@ def load_config() -> Tuple[str, str, str, str]:
     logs_dir = os.environ.get("LOGS_DIR")
     task_id = os.environ.get("TASK_ID")
     
+    # Optional settings
+    compress_logs = os.environ.get("COMPRESS_LOGS", "1").lower() not in ("0", "false", "no")
+    
     # Validate required environment variables
     if not credentials_path:
         logger.error("CREDENTIALS_PATH environment variable is not set")
+    elif not os.path.isfile(credentials_path):
+        logger.error(f"Credentials file not found at: {credentials_path}")
+        credentials_path = None
     if not storage_bucket:
         logger.error("STORAGE_BUCKET environment variable is not set")
     if not logs_dir:
@@ -186,44 +456,408 @@ def load_config() -> Tuple[str, str, str, str]:
     if not task_id:
         logger.error("TASK_ID environment variable is not set")
     
-    return credentials_path, storage_bucket, logs_dir, task_id
+    return credentials_path, storage_bucket, logs_dir, task_id, compress_logs
+
+
+def is_connectivity_error(error: Exception) -> bool:
+    """
+    Check whether an upload error looks like a lost network connection.
+    
+    Args:
+        error: Exception raised by the upload
+        
+    Returns:
+        True for connection, DNS and timeout errors (including when they are
+        the cause of a wrapping retry error), False otherwise
+    """
+    for exc in (error, error.__cause__):
+        if isinstance(exc, CONNECTIVITY_ERRORS):
+            return True
+    return False
+
+
+def do_upload(file_path: str, task_id: str, compress: bool = False) -> bool:
+    """
+    Upload a single log file to logs/{task_id}.bin in Firebase Storage.
+    
+    Args:
+        file_path: Path to the local log file
+        task_id: Task identifier used in the destination path
+        compress: Upload the log zstd-compressed as {task_id}.bin.zst
+        
+    Returns:
+        True if the upload was successful, False otherwise
+    """
+    destination_path = f"logs/{task_id}.bin"
+    if compress:
+        destination_path += ".zst"
+    if not upload_to_firebase(file_path, destination_path, compress):
+        logger.error("Upload failed")
+        return False
+    
+    logger.info(f"Upload completed successfully to {destination_path}")
+    return True
+
+
+def run_once(task_id: str, logs_dir: str, compress: bool = False) -> bool:
+    """
+    Find the latest log file and upload it to Firebase Storage.
+    
+    Firebase must already be initialized, so this can be called repeatedly
+    from a long-running process without reloading credentials.
+    
+    Args:
+        task_id: Task identifier used in the destination path
+        logs_dir: Path to the directory containing log files
+        compress: Upload the log zstd-compressed as {task_id}.bin.zst
+        
+    Returns:
+        True if a log file was found and uploaded, False otherwise
+    """
+    # Find the latest log file
+    latest_log = find_latest_bin_file(logs_dir)
+    if not latest_log:
+        logger.error("No log file found to upload")
+        return False
+    
+    return do_upload(latest_log, task_id, compress)
+
+
+def load_upload_state(state_path: str) -> Dict[str, float]:
+    """
+    Load the record of log files that have already been uploaded.
+    
+    Args:
+        state_path: Path to the JSON state file
+        
+    Returns:
+        Dictionary mapping uploaded log paths to their mtime at upload time
+    """
+    try:
+        with open(state_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable upload state file {state_path}: {str(e)}")
+        return {}
+
+
+def save_upload_state(state_path: str, state: Dict[str, float]) -> None:
+    """
+    Atomically write the record of uploaded log files.
+    
+    Args:
+        state_path: Path to the JSON state file
+        state: Dictionary mapping uploaded log paths to their mtime
+    """
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(temp_path, state_path)
+
+
+def create_log_bundle(log_files: List[str], out) -> None:
+    """
+    Write log files into a single zstd-compressed tar stream.
+    
+    Args:
+        log_files: Paths of the log files to include
+        out: Binary file object the .tar.zst stream is written to
+    """
+    cctx = zstd.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+    with cctx.stream_writer(out, closefd=False) as writer:
+        with tarfile.open(fileobj=writer, mode="w|") as tar:
+            for log_file in log_files:
+                # Keep the full source path so same-named logs from different mounts don't collide
+                tar.add(log_file, arcname=log_file.lstrip(os.sep))
+
+
+class BundleReader:
+    """
+    Read end of the bundle pipe, as seen by the resumable upload.
+    
+    Pipes cannot tell() their position, so it is tracked here. If the bundle
+    writer failed, the error is raised at end of stream so the upload is
+    aborted instead of finalizing a truncated bundle.
+    """
+    
+    def __init__(self, pipe, writer_errors: List[Exception]):
+        self._pipe = pipe
+        self._writer_errors = writer_errors
+        self._position = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self._pipe.read(size)
+        if (size < 0 or len(data) < size) and self._writer_errors:
+            raise self._writer_errors[0]
+        self._position += len(data)
+        return data
+    
+    def tell(self) -> int:
+        return self._position
+
+
+def upload_log_bundle(log_files: List[str], destination_path: str) -> None:
+    """
+    Stream log files as a tar.zst bundle straight into Firebase Storage.
+    
+    The bundle is built on a background thread and piped into a chunked
+    resumable upload, so it never touches local disk. A pipe cannot be
+    rewound, so a failed upload is not resumed; the whole bundle is
+    retried on the next run.
+    
+    Args:
+        log_files: Paths of the log files to include
+        destination_path: Destination path in Firebase Storage
+        
+    Raises:
+        Exception: Any error from reading the logs or from the Storage API
+    """
+    read_fd, write_fd = os.pipe()
+    writer_errors: List[Exception] = []
+    
+    def write_bundle():
+        try:
+            with open(write_fd, "wb") as out:
+                try:
+                    create_log_bundle(log_files, out)
+                except Exception as e:
+                    # Recorded before the pipe closes so the reader sees it at EOF
+                    writer_errors.append(e)
+        except OSError:
+            # The upload side closed the pipe first; its error is reported there
+            pass
+    
+    writer = threading.Thread(target=write_bundle, daemon=True)
+    writer.start()
+    try:
+        with open(read_fd, "rb") as pipe:
+            blob = storage.bucket().blob(destination_path, chunk_size=UPLOAD_CHUNK_SIZE)
+            blob.upload_from_file(
+                BundleReader(pipe, writer_errors),
+                content_type="application/zstd",
+                timeout=600,
+                if_generation_match=0
+            )
+    finally:
+        # Closing the read end unblocks the writer if the upload gave up early
+        writer.join()
+
+
+def run_bundle(task_id: str, logs_dir: str, state_path: str) -> bool:
+    """
+    Upload all log files not yet uploaded as one tar.zst bundle.
+    
+    Each bundle gets its own object, logs/{task_id}_{UTC time}_{hash}.tar.zst,
+    and is uploaded with an if_generation_match=0 precondition so earlier
+    bundles are never overwritten. Uploaded files are recorded in the state
+    file only after the bundle upload succeeds, so a failed run is retried
+    in full next time.
+    
+    Args:
+        task_id: Task identifier used in the destination path
+        logs_dir: Path to the directory containing log files
+        state_path: Path to the JSON file tracking uploaded logs
+        
+    Returns:
+        True if the bundle was uploaded or there was nothing new, False otherwise
+    """
+    state = load_upload_state(state_path)
+    new_logs = [(path, mtime) for path, mtime in iter_bin_files(logs_dir) if state.get(path) != mtime]
+    if not new_logs:
+        logger.info("No new log files to bundle")
+        return True
+    
+    # Name each bundle uniquely so it never replaces an earlier one
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    contents = "\n".join(f"{path}:{mtime}" for path, mtime in sorted(new_logs))
+    digest = hashlib.sha256(contents.encode()).hexdigest()[:8]
+    destination_path = f"logs/{task_id}_{timestamp}_{digest}.tar.zst"
+    
+    logger.info(f"Bundling {len(new_logs)} new log files")
+    try:
+        upload_log_bundle([path for path, _ in new_logs], destination_path)
+    except Exception as e:
+        # A log may vanish (Pixhawk unplugged) or become unreadable mid-bundle
+        logger.error(f"Bundle upload failed: {str(e)}")
+        return False
+    
+    state.update(new_logs)
+    save_upload_state(state_path, state)
+    logger.info(f"Uploaded bundle of {len(new_logs)} log files to {destination_path}")
+    return True
+
+
+def watch_logs(task_id: str, logs_dir: str, state_path: str, compress: bool = False) -> int:
+    """
+    Run as a daemon, uploading each new .bin file as soon as it is written.
+    
+    Watches logs_dir and every discovered Pixhawk log directory with inotify.
+    Mount bases are re-probed every WATCH_RESCAN_INTERVAL seconds, and
+    newly plugged-in Pixhawk log directories are watched from then on.
+    Logs not yet recorded in the state file (including those present at
+    startup or on a newly mounted Pixhawk) are queued as pending, and
+    pending uploads are retried on every rescan. A connectivity failure
+    ends the pass until the next rescan; any other failure only affects
+    that file, which is dropped after WATCH_MAX_ATTEMPTS attempts until it
+    is written again or the daemon restarts. Firebase stays initialized for the lifetime of the process, so
+    credentials and HTTP connections are reused across uploads. Each log is
+    uploaded to logs/{task_id}_{log name}_{hash}.bin, where the hash covers
+    the source path and mtime, with an if_generation_match=0 precondition
+    so no upload ever replaces an existing object.
+    
+    Args:
+        task_id: Task identifier used as the destination path prefix
+        logs_dir: Path to the directory containing log files
+        state_path: Path to the JSON file tracking uploaded logs
+        compress: Upload logs zstd-compressed
+        
+    Returns:
+        Exit code (only returns if no directory could be watched)
+    """
+    # inotify is Linux-only, so only require it when watching
+    from inotify_simple import INotify, flags
+    
+    inotify = INotify()
+    watch_flags = flags.CLOSE_WRITE | flags.MOVED_TO
+    watched_dirs = {}  # watch descriptor -> directory
+    state = load_upload_state(state_path)
+    pending = set()
+    failed_attempts = {}  # path -> consecutive non-connectivity failures
+    
+    def queue_unuploaded(path):
+        try:
+            for file_path, mtime in scan_bin_files(path):
+                if state.get(file_path) != mtime:
+                    pending.add(file_path)
+        except OSError as e:
+            logger.warning(f"Could not read {path}: {str(e)}")
+    
+    def upload_pending():
+        for file_path in sorted(pending):
+            try:
+                mtime = os.stat(file_path).st_mtime
+            except OSError:
+                # Log was deleted or its device unmounted before it could be uploaded
+                pending.discard(file_path)
+                failed_attempts.pop(file_path, None)
+                continue
+            # Same-named logs from different directories, or from before an SD
+            # card reformat, must not share an object, so tag each with a hash
+            # of its source path and mtime
+            log_name = os.path.splitext(os.path.basename(file_path))[0]
+            digest = hashlib.sha256(f"{os.path.abspath(file_path)}:{mtime}".encode()).hexdigest()[:8]
+            destination_path = f"logs/{task_id}_{log_name}_{digest}.bin"
+            if compress:
+                destination_path += ".zst"
+            try:
+                upload_file_to_storage(file_path, destination_path, compress, if_generation_match=0)
+            except api_exceptions.PreconditionFailed:
+                # This exact log was already uploaded (e.g. before the state file was saved)
+                logger.info(f"{destination_path} already exists; skipping {file_path}")
+            except Exception as e:
+                if is_connectivity_error(e):
+                    # Offline; every other upload would fail the same way
+                    logger.warning(f"Upload of {file_path} failed, connection unavailable: {str(e)}; "
+                                   f"{len(pending)} log files pending, retrying in {WATCH_RESCAN_INTERVAL}s")
+                    return
+                failed_attempts[file_path] = failed_attempts.get(file_path, 0) + 1
+                if failed_attempts[file_path] >= WATCH_MAX_ATTEMPTS:
+                    logger.error(f"Giving up on {file_path} after {WATCH_MAX_ATTEMPTS} failed attempts: {str(e)}")
+                    pending.discard(file_path)
+                    failed_attempts.pop(file_path)
+                else:
+                    logger.warning(f"Upload of {file_path} failed (attempt {failed_attempts[file_path]} "
+                                   f"of {WATCH_MAX_ATTEMPTS}): {str(e)}")
+                continue
+            state[file_path] = mtime
+            save_upload_state(state_path, state)
+            pending.discard(file_path)
+            failed_attempts.pop(file_path, None)
+    
+    def add_watches(paths):
+        current = {os.path.normpath(path) for path in watched_dirs.values()}
+        for path in paths:
+            if os.path.normpath(path) in current:
+                continue
+            try:
+                wd = inotify.add_watch(path, watch_flags)
+            except OSError as e:
+                logger.warning(f"Cannot watch {path}: {str(e)}")
+                continue
+            watched_dirs[wd] = path
+            current.add(os.path.normpath(path))
+            logger.info(f"Watching {path} for new .bin files")
+            
+            # Logs already in the directory produce no write events
+            queue_unuploaded(path)
+    
+    add_watches([logs_dir] + find_pixhawk_mount_paths())
+    if not watched_dirs:
+        logger.error("No log directories could be watched")
+        return 1
+    
+    while True:
+        upload_pending()
+        
+        for event in inotify.read(timeout=int(WATCH_RESCAN_INTERVAL * 1000)):
+            if event.mask & flags.IGNORED:
+                # Directory was removed or unmounted
+                path = watched_dirs.pop(event.wd, None)
+                if path:
+                    logger.info(f"Stopped watching {path}")
+                continue
+            if event.wd in watched_dirs and event.name.endswith(".bin"):
+                pending.add(os.path.join(watched_dirs[event.wd], event.name))
+        
+        add_watches(find_pixhawk_mount_paths(log_level=logging.DEBUG))
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Upload ArduPilot flight logs to Firebase Storage")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Upload all logs not yet uploaded as a single logs/{TASK_ID}_{time}_{hash}.tar.zst bundle (or set BUNDLE=1)"
+    )
+    mode.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and upload each new .bin file as soon as it is written"
+    )
+    return parser.parse_args()
 
 
 def main():
     """Main entry point for the script."""
+    args = parse_args()
+    
     # Load configuration
-    credentials_path, storage_bucket, logs_dir, task_id = load_config()
+    credentials_path, storage_bucket, logs_dir, task_id, compress_logs = load_config()
     
     # Validate configuration
     if not all([credentials_path, storage_bucket, logs_dir, task_id]):
         logger.error("Missing required configuration. Please check your .env file.")
         return 1
     
-    # Find the latest log file
-    latest_log = find_latest_bin_file(logs_dir)
-    if not latest_log:
-        logger.error("No log file found to upload")
-        return 1
-    
     # Initialize Firebase
     app = initialize_firebase(credentials_path, storage_bucket)
     if not app:
         logger.error("Failed to initialize Firebase")
         return 1
     
-    # Upload the log file
-    destination_path = f"logs/{task_id}.bin"
-    success = upload_to_firebase(latest_log, destination_path)
+    state_path = os.environ.get("UPLOAD_STATE_FILE", DEFAULT_UPLOAD_STATE_FILE)
     
-    # Clean up Firebase resources
-    firebase_admin.delete_app(app)
+    if args.watch:
+        return watch_logs(task_id, logs_dir, state_path, compress_logs)
     
-    if success:
-        logger.info(f"Upload completed successfully to {destination_path}")
-        return 0
-    else:
-        logger.error("Upload failed")
-        return 1
+    if args.bundle or os.environ.get("BUNDLE") == "1":
+        return 0 if run_bundle(task_id, logs_dir, state_path) else 1
+    
+    return 0 if run_once(task_id, logs_dir, compress_logs) else 1
 
 
 if __name__ == "__main__":
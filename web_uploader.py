@@ -7,13 +7,23 @@ It's designed to run on a headless server and be accessed via a web browser.
 """
 import os
 import logging
-from flask import Flask, request, render_template, flash, redirect, url_for
+import time
+from datetime import timedelta
+from flask import Flask, request, render_template, flash, redirect, session, url_for
 import firebase_admin
 from firebase_admin import credentials, storage
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage as gcs
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
-import tempfile
-import shutil
+from waitress import serve
+
+# Pin TZ so glibc does not re-stat /etc/localtime for every log timestamp
+os.environ.setdefault("TZ", ":/etc/localtime")
+if hasattr(time, "tzset"):
+    time.tzset()
 
 # Set up logging
 logging.basicConfig(
@@ -27,8 +37,31 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100 MB max upload size
 
-# Global variable for Firebase app
+# Configuration file and the variables that must be set
+DOTENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+REQUIRED_ENV_VARS = ("CREDENTIALS_PATH", "STORAGE_BUCKET")
+
+# Resumable upload chunk size (GCS requires a multiple of 256 KiB)
+UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024  # 32 MiB
+
+# Number of worker threads handling concurrent uploads
+WEB_SERVER_THREADS = 8
+
+# Maximum (and default) lifetime of download URLs allowed for V4 signatures
+MAX_SIGNED_URL_EXPIRATION_DAYS = 7
+
+# Number of direct upload sessions remembered per browser session
+MAX_ISSUED_UPLOADS = 10
+
+# Size of the shared HTTP connection pool used for Storage requests
+HTTP_POOL_SIZE = 16
+
+# Global variables for Firebase app and the shared Storage bucket handle
 firebase_app = None
+firebase_bucket = None
+
+# Lifetime of signed download URLs, set from the environment in main()
+signed_url_expiration = timedelta(days=MAX_SIGNED_URL_EXPIRATION_DAYS)
 
 def initialize_firebase(credentials_path, bucket_name):
     """
@@ -52,33 +85,135 @@ def initialize_firebase(credentials_path, bucket_name):
         logger.error(f"Failed to initialize Firebase: {str(e)}")
         return None
 
-def upload_to_firebase(file_path, destination_path):
+def create_storage_bucket(app, bucket_name):
+    """
+    Create a Storage bucket handle backed by a pooled, retrying HTTP session.
+    
+    The handle is meant to be created once and shared by all requests so
+    uploads reuse warm TLS connections instead of opening new ones.
+    
+    Args:
+        app: Initialized Firebase app instance
+        bucket_name: Name of the Storage bucket
+        
+    Returns:
+        google.cloud.storage Bucket instance or None if creation failed
+    """
+    try:
+        cred = app.credential.get_credential()
+        http_session = AuthorizedSession(cred)
+        # Only retry failed connections here; HTTP error statuses are retried
+        # by google-cloud-storage's own policy, which understands resumable uploads
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE,
+            pool_maxsize=HTTP_POOL_SIZE,
+            max_retries=Retry(
+                total=5,
+                connect=5,
+                read=0,
+                status=0,
+                backoff_factor=0.2,
+                status_forcelist=(),
+                respect_retry_after_header=False
+            )
+        )
+        http_session.mount("https://", adapter)
+        
+        client = gcs.Client(project=app.project_id, credentials=cred, _http=http_session)
+        return client.bucket(bucket_name)
+    except Exception as e:
+        logger.error(f"Failed to create Storage client: {str(e)}")
+        return None
+
+def generate_download_url(blob):
     """
-    Upload a file to Firebase Storage.
+    Sign a download URL for an uploaded blob.
+    
+    The URL is signed locally instead of changing the object ACL, so it
+    costs no extra request and works with uniform bucket-level access.
     
     Args:
-        file_path: Path to the local file to upload
+        blob: Uploaded Storage blob
+        
+    Returns:
+        V4 signed GET URL
+    """
+    return blob.generate_signed_url(
+        version="v4",
+        expiration=signed_url_expiration,
+        method="GET"
+    )
+
+def load_signed_url_expiration():
+    """
+    Read the signed download URL lifetime from the environment.
+    
+    Values above the V4 signing limit of 7 days are clamped to 7 days.
+    
+    Returns:
+        timedelta for the URL lifetime, or None if the setting is invalid
+    """
+    value = os.environ.get("SIGNED_URL_EXPIRATION_DAYS")
+    if not value:
+        return timedelta(days=MAX_SIGNED_URL_EXPIRATION_DAYS)
+    
+    try:
+        expiration_days = float(value)
+    except ValueError:
+        logger.error(f"SIGNED_URL_EXPIRATION_DAYS must be a number of days, got: {value}")
+        return None
+    
+    if not expiration_days > 0:
+        logger.error(f"SIGNED_URL_EXPIRATION_DAYS must be positive, got: {value}")
+        return None
+    if expiration_days > MAX_SIGNED_URL_EXPIRATION_DAYS:
+        logger.warning(f"SIGNED_URL_EXPIRATION_DAYS={value} exceeds the V4 limit; using {MAX_SIGNED_URL_EXPIRATION_DAYS} days")
+        expiration_days = MAX_SIGNED_URL_EXPIRATION_DAYS
+    
+    return timedelta(days=expiration_days)
+
+def upload_to_firebase(file_obj, destination_path, content_type=None):
+    """
+    Upload a file-like object to Firebase Storage.
+    
+    Args:
+        file_obj: Readable binary file-like object positioned at the start
         destination_path: Destination path in Firebase Storage
+        content_type: MIME type to store with the object
         
     Returns:
         True if upload was successful, False otherwise
     """
     try:
-        bucket = storage.bucket()
-        blob = bucket.blob(destination_path)
-        
-        # Upload the file
-        blob.upload_from_filename(file_path)
-        logger.info(f"File uploaded to {destination_path}")
+        bucket = firebase_bucket or storage.bucket()
+        blob = bucket.blob(destination_path, chunk_size=UPLOAD_CHUNK_SIZE)
         
-        # Make the file publicly accessible
-        blob.make_public()
-        logger.info(f"Download URL: {blob.public_url}")
+        # Determine the size without reading the stream
+        file_obj.seek(0, os.SEEK_END)
+        file_size = file_obj.tell()
+        file_obj.seek(0)
         
-        return True, blob.public_url
+        # Stream the file through a resumable upload with large chunks
+        blob.upload_from_file(
+            file_obj,
+            size=file_size,
+            content_type=content_type or "application/octet-stream",
+            timeout=600
+        )
+        logger.info(f"File uploaded to {destination_path}")
     except Exception as e:
         logger.error(f"Upload failed: {str(e)}")
         return False, None
+    
+    # The object is already stored, so a signing failure only loses the link
+    try:
+        url = generate_download_url(blob)
+        logger.info(f"Download URL: {url}")
+    except Exception as e:
+        logger.error(f"Failed to sign download URL for {destination_path}: {str(e)}")
+        url = None
+    
+    return True, url
 
 def load_config():
     """
@@ -87,7 +222,9 @@ def load_config():
     Returns:
         Tuple of (credentials_path, storage_bucket)
     """
-    load_dotenv()
+    # Load the .env file next to this script unless the environment already provides the config
+    if not all(os.environ.get(key) for key in REQUIRED_ENV_VARS):
+        load_dotenv(dotenv_path=DOTENV_PATH, override=False)
     
     credentials_path = os.environ.get("CREDENTIALS_PATH")
     storage_bucket = os.environ.get("STORAGE_BUCKET")
@@ -113,7 +250,7 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Handle log file upload"""
+    """Handle log file upload proxied through the server (fallback for direct uploads)"""
     if 'logfile' not in request.files:
         flash('No file selected')
         return redirect(request.url)
@@ -125,28 +262,93 @@ def upload_file():
     
     task_id = request.form.get('task_id', 'undefined_task')
     
-    # Create a temporary file to store the uploaded content
-    temp_dir = tempfile.mkdtemp()
+    safe_name = secure_filename(file.filename)
+    
+    # Stream the uploaded content straight to Firebase
+    destination_path = f"logs/{task_id}_{safe_name}"
+    success, url = upload_to_firebase(file.stream, destination_path, file.mimetype)
+    
+    if success:
+        flash(f'File uploaded successfully to {destination_path}')
+        if url:
+            flash(f'Download URL: {url}')
+        return render_template('success.html', filename=file.filename, task_id=task_id, url=url)
+    else:
+        flash('Upload failed. Please check logs for details.')
+        return redirect('/')
+
+@app.route('/presign', methods=['POST'])
+def presign_upload():
+    """Create a resumable upload session so the browser can upload straight to Storage"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return {"error": "Expected a JSON object"}, 400
+    filename = data.get('filename')
+    size = data.get('size')
+    task_id = data.get('task_id') or 'undefined_task'
+    
+    if not isinstance(filename, str) or not filename or isinstance(size, bool) or not isinstance(size, int) or size <= 0:
+        return {"error": "filename and size are required"}, 400
+    if not isinstance(task_id, str):
+        return {"error": "task_id must be a string"}, 400
+    safe_name = secure_filename(filename)
+    if not safe_name:
+        return {"error": "Invalid filename"}, 400
+    if size > app.config['MAX_CONTENT_LENGTH']:
+        return {"error": "File is too large"}, 413
+    
+    destination_path = f"logs/{task_id}_{safe_name}"
     try:
-        temp_path = os.path.join(temp_dir, secure_filename(file.filename))
-        file.save(temp_path)
-        
-        # Upload to Firebase
-        destination_path = f"logs/{task_id}_{os.path.basename(secure_filename(file.filename))}"
-        success, url = upload_to_firebase(temp_path, destination_path)
-        
-        if success:
-            flash(f'File uploaded successfully to {destination_path}')
-            if url:
-                flash(f'Download URL: {url}')
-            return render_template('success.html', filename=file.filename, task_id=task_id, url=url)
-        else:
-            flash('Upload failed. Please check logs for details.')
+        bucket = firebase_bucket or storage.bucket()
+        blob = bucket.blob(destination_path)
+        # The session is bound to this size, and to the page origin for CORS
+        upload_url = blob.create_resumable_upload_session(
+            content_type="application/octet-stream",
+            size=size,
+            origin=request.origin
+        )
+    except Exception as e:
+        logger.error(f"Failed to create upload session: {str(e)}")
+        return {"error": "Could not create upload session"}, 500
+    
+    # Remember the issued path so /complete only confirms uploads this client started
+    issued_paths = session.get('issued_uploads', [])
+    issued_paths.append(destination_path)
+    session['issued_uploads'] = issued_paths[-MAX_ISSUED_UPLOADS:]
+    
+    logger.info(f"Created direct upload session for {destination_path}")
+    return {"upload_url": upload_url, "destination_path": destination_path}
+
+@app.route('/complete', methods=['POST'])
+def complete_upload():
+    """Confirm a direct browser upload and show its download link"""
+    task_id = request.form.get('task_id', 'undefined_task')
+    filename = request.form.get('filename', '')
+    destination_path = request.form.get('destination_path', '')
+    
+    issued_paths = session.get('issued_uploads', [])
+    if destination_path not in issued_paths:
+        flash('Invalid upload destination.')
+        return redirect('/')
+    issued_paths.remove(destination_path)
+    session['issued_uploads'] = issued_paths
+    
+    try:
+        bucket = firebase_bucket or storage.bucket()
+        blob = bucket.blob(destination_path)
+        if not blob.exists():
+            flash('Upload could not be found in storage. Please try again.')
             return redirect('/')
+        url = generate_download_url(blob)
+    except Exception as e:
+        logger.error(f"Failed to confirm upload: {str(e)}")
+        flash('Upload failed. Please check logs for details.')
+        return redirect('/')
     
-    finally:
-        # Clean up temp directory
-        shutil.rmtree(temp_dir)
+    logger.info(f"Direct upload confirmed at {destination_path}")
+    flash(f'File uploaded successfully to {destination_path}')
+    flash(f'Download URL: {url}')
+    return render_template('success.html', filename=filename, task_id=task_id, url=url)
 
 @app.route('/health')
 def health():
@@ -161,16 +363,30 @@ def main():
         logger.error("Failed to load required configuration. Check your .env file.")
         return 1
     
+    # Use a fixed secret key when provided so sessions survive restarts and are shared across workers
+    secret_key = os.environ.get("SECRET_KEY")
+    if secret_key:
+        app.config['SECRET_KEY'] = secret_key
+    
+    global signed_url_expiration
+    signed_url_expiration = load_signed_url_expiration()
+    if not signed_url_expiration:
+        return 1
+    
     # Initialize Firebase
-    global firebase_app
+    global firebase_app, firebase_bucket
     firebase_app = initialize_firebase(credentials_path, storage_bucket)
     if not firebase_app:
         logger.error("Failed to initialize Firebase.")
         return 1
+    firebase_bucket = create_storage_bucket(firebase_app, storage_bucket)
+    if not firebase_bucket:
+        logger.error("Failed to create Storage client.")
+        return 1
     
-    # Run the Flask app
-    logger.info("Starting web server on port 5000...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Serve the Flask app with a threaded production WSGI server
+    logger.info(f"Starting web server on port 5000 with {WEB_SERVER_THREADS} threads...")
+    serve(app, host='0.0.0.0', port=5000, threads=WEB_SERVER_THREADS)
     return 0
 
 if __name__ == "__main__":